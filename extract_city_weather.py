@@ -1,21 +1,75 @@
 import warnings
+import atexit
+import csv
+import io
 import subprocess
 import platform
+import signal
+import socket
+from urllib.parse import urlparse
 import requests
-import pandas as pd
-from sqlalchemy import create_engine
-import schedule
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import logging
-import json
+from operator import itemgetter
+import orjson
 import os
 import sys
-import psycopg2
-from psycopg2 import sql
+import zlib
 # Suppress all warnings
 warnings.filterwarnings("ignore")
 
+WEATHER_API_URL = "http://api.openweathermap.org/data/2.5/weather"
+# Top-level sections of the API response that the reading is built from
+API_RESPONSE_FIELDS = itemgetter('main', 'wind', 'weather')
+
+# Transient API errors are retried with exponential backoff within the same run, honouring Retry-After
+API_RETRY = Retry(
+    total=5, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], respect_retry_after_header=True
+)
+# After this many consecutive failed runs the poll interval is doubled per further failure, up to the cap
+FAILURE_THRESHOLD = 3
+MAX_BACKOFF_FACTOR = 32
+# Rows kept for retry after failed flushes are capped; the oldest are dropped beyond this
+MAX_BUFFERED_ROWS = 10000
+
+# Columns of the weather table, in the order rows are inserted. The names need no quoting,
+# so the statements below are plain strings and don't require psycopg2 at import time.
+WEATHER_COLUMNS = ['city', 'temperature_c', 'humidity', 'wind_speed_ms', 'weather', 'timestamp']
+
+CREATE_WEATHER_TABLE = (
+    "CREATE TABLE IF NOT EXISTS weather ("
+    "city TEXT, temperature_c REAL, humidity SMALLINT, wind_speed_ms REAL, weather TEXT, "
+    "timestamp TIMESTAMPTZ NOT NULL DEFAULT now())"
+)
+# Tables created by earlier versions use pandas' column names and types; they are converted in place.
+# The statements run as one implicit transaction, so a failed migration leaves the table untouched.
+FIND_LEGACY_WEATHER_TABLE = (
+    "SELECT 1 FROM information_schema.columns "
+    "WHERE table_schema = current_schema() AND table_name = 'weather' AND column_name = %s"
+)
+MIGRATE_LEGACY_WEATHER_TABLE = (
+    'ALTER TABLE weather RENAME COLUMN "temperature (°C)" TO temperature_c; '
+    'ALTER TABLE weather RENAME COLUMN "humidity (%)" TO humidity; '
+    'ALTER TABLE weather RENAME COLUMN "wind_speed (m/s)" TO wind_speed_ms; '
+    "ALTER TABLE weather ALTER COLUMN temperature_c TYPE REAL, ALTER COLUMN humidity TYPE SMALLINT, "
+    "ALTER COLUMN wind_speed_ms TYPE REAL, ALTER COLUMN timestamp TYPE TIMESTAMPTZ, "
+    "ALTER COLUMN timestamp SET DEFAULT now(), ALTER COLUMN timestamp SET NOT NULL"
+)
+# Rows are appended in time order, so a tiny BRIN index covers range queries on timestamp
+CREATE_WEATHER_TIMESTAMP_INDEX = "CREATE INDEX IF NOT EXISTS weather_ts_brin ON weather USING BRIN (timestamp)"
+# Single-row inserts go through a server-side prepared statement, parsed and planned once per connection
+# (the column lists are filled in per collector, see WeatherDataCollector.__init__). The statement is
+# named after its column list, so collectors inserting different columns don't collide on a connection.
+INSERT_WEATHER_NAME = "insert_weather_{digest:08x}"
+INSERT_WEATHER = "INSERT INTO weather ({columns}) VALUES ({params})"
+EXECUTE_INSERT_WEATHER = "EXECUTE {name} ({params})"
+# Batches are bulk-loaded with COPY in a single round trip, so there is no executemany path to tune
+COPY_WEATHER = "COPY weather ({columns}) FROM STDIN WITH (FORMAT CSV)"
+
 
 # Configure logging
 logging.basicConfig(
@@ -25,13 +79,32 @@ logging.basicConfig(
     datefmt='%Y-%m-%d %H:%M:%S'
 )
 
-def check_postgresql_status():
+# Set once PostgreSQL is known to be running so the service probes only run once per process
+_PG_STARTED = False
+
+# Connection pool shared by all work on the weather database, created on first use
+_POOL = None
+# Names of the statements prepared on each pooled connection, keyed by the connection object itself
+_PREPARED_STATEMENTS = {}
+
+def check_postgresql_status(host: str = 'localhost', port: int = 5432):
     """
-    Checks if the PostgreSQL service is running.
+    Checks if the PostgreSQL service is running. A TCP connection to the server is tried
+    first; the OS service manager is only queried if nothing accepts it.
     
+    Args:
+        host (str): The host PostgreSQL listens on.
+        port (int): The port PostgreSQL listens on.
+
     Returns:
         bool: True if PostgreSQL is running, False otherwise.
     """
+    try:
+        with socket.create_connection((host, port), timeout=0.2):
+            return True
+    except OSError:
+        pass  # Not listening there, or running on another port; ask the service manager
+
     system = platform.system()
     
     try:
@@ -58,13 +131,23 @@ def check_postgresql_status():
         logging.error(f"An unexpected error occurred while checking service status: {e}")
         return False
 
-def start_postgresql():
+def start_postgresql(host: str = 'localhost', port: int = 5432):
     """
     Starts the PostgreSQL service in a system-agnostic way if it is not already running.
     Works for Windows, macOS (with Homebrew), and Linux (with systemd or service).
+    Subsequent calls return immediately once the service has been found or started.
+
+    Args:
+        host (str): The host PostgreSQL listens on.
+        port (int): The port PostgreSQL listens on.
     """
-    if check_postgresql_status():
+    global _PG_STARTED
+    if _PG_STARTED:
+        return
+
+    if check_postgresql_status(host, port):
         logging.info("PostgreSQL service is already running.")
+        _PG_STARTED = True
         return
     
     system = platform.system()
@@ -89,16 +172,20 @@ def start_postgresql():
             except subprocess.CalledProcessError as e:
                 logging.error(f"Error starting PostgreSQL service on Windows: {e}")
                 logging.error("Ensure you have administrative privileges to start the PostgreSQL service.")
+                return
         
         else:
             logging.error(f"Unsupported operating system: {system}")
             raise EnvironmentError(f"Unsupported operating system: {system}")
 
+        _PG_STARTED = True
+
     except subprocess.CalledProcessError as e:
         logging.error(f"Error starting PostgreSQL service: {e}")
     except Exception as e:
         logging.error(f"An unexpected error occurred: {e}")
 
+# The database helpers below import psycopg2 on first database use rather than at module import
 def create_database_if_not_exists(db_url: str):
     """
     Creates the database if it does not exist.
@@ -113,6 +200,9 @@ def create_database_if_not_exists(db_url: str):
     # Construct the connection URL for the default 'postgres' database
     conn_url = base_url + '/postgres'
 
+    import psycopg2
+    from psycopg2 import sql
+
     try:
         # Connect to PostgreSQL using psycopg2
         conn = psycopg2.connect(conn_url)
@@ -132,10 +222,73 @@ def create_database_if_not_exists(db_url: str):
         if conn:
             conn.close()
 
+def get_connection_pool(db_url: str):
+    """
+    Returns the connection pool for the weather database, creating it on first use.
+    The pool keeps at most 4 connections, with TCP keepalives so idle ones survive NAT timeouts.
+
+    Args:
+        db_url (str): The full database URL including the database name.
+
+    Returns:
+        psycopg2.pool.ThreadedConnectionPool: The shared connection pool.
+    """
+    global _POOL
+    if _POOL is None:
+        from psycopg2.pool import ThreadedConnectionPool
+
+        _POOL = ThreadedConnectionPool(1, 4, dsn=db_url, keepalives=1, keepalives_idle=60)
+    return _POOL
+
+def prepare_statement(cursor, name: str, statement: str):
+    """
+    Prepares a statement on the cursor's connection unless it is already prepared there.
+    Closed connections are forgotten, so a connection that replaces one always prepares afresh.
+
+    Args:
+        cursor (psycopg2.extensions.cursor): A cursor on a pooled connection.
+        name (str): The name of the prepared statement.
+        statement (str): The statement to prepare, with $1, $2, ... parameters.
+    """
+    for conn in [conn for conn in _PREPARED_STATEMENTS if conn.closed]:
+        del _PREPARED_STATEMENTS[conn]
+    prepared = _PREPARED_STATEMENTS.setdefault(cursor.connection, set())
+    if name not in prepared:
+        cursor.execute(f"PREPARE {name} AS {statement}")
+        prepared.add(name)
+
+def create_weather_table_if_not_exists(db_url: str):
+    """
+    Creates the weather table and its timestamp index if they do not exist. A weather table
+    left by an earlier version (with columns such as "temperature (°C)") is migrated first.
+
+    Args:
+        db_url (str): The full database URL including the database name.
+    """
+    import psycopg2
+
+    conn = None
+    try:
+        conn = get_connection_pool(db_url).getconn()
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(FIND_LEGACY_WEATHER_TABLE, ('temperature (°C)',))
+            if cursor.fetchone():
+                cursor.execute(MIGRATE_LEGACY_WEATHER_TABLE)
+                logging.info("Migrated table 'weather' from the previous column layout.")
+            cursor.execute(CREATE_WEATHER_TABLE)
+            cursor.execute(CREATE_WEATHER_TIMESTAMP_INDEX)
+        logging.info("Table 'weather' is ready.")
+    except psycopg2.Error as e:
+        logging.error(f"Error creating table 'weather': {e}")
+    finally:
+        if conn:
+            get_connection_pool(db_url).putconn(conn)
+
 
 class WeatherDataCollector:
     """
-    A class responsible for collecting, cleaning, and storing weather data.
+    A class responsible for collecting and storing weather data for one or more cities.
     """
 
     def __init__(self, config: dict):
@@ -143,93 +296,198 @@ class WeatherDataCollector:
         Initializes the WeatherDataCollector with necessary configurations.
 
         Args:
-            config (dict): Configuration dictionary with API key, city, and database URL.
+            config (dict): Configuration dictionary with API key, city (or a list of cities), and database URL.
         """
-        self.city = config['city']
+        self.cities = config.get('cities') or [config['city']]
         self.api_key = config['api_key']
         self.db_url = config['db_url']
-        logging.info(f"Initialized WeatherDataCollector for city: {self.city}")
-
-    def get_weather_data(self) -> dict:
+        # Query parameters are built once; requests handles the URL encoding (e.g. city names with spaces)
+        self.params = {city: {'q': city, 'appid': self.api_key, 'units': 'metric'} for city in self.cities}
+        # Cities are fetched concurrently, with at most `max_concurrent_requests` requests in flight
+        max_workers = min(len(self.cities), config.get('max_concurrent_requests', 10))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Reuse keep-alive connections to the API across runs instead of reconnecting every time
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(
+            pool_connections=1, pool_maxsize=max_workers, max_retries=API_RETRY
+        ))
+        # Per-city validators and reading from the last full response, used for conditional requests
+        self.etags = {}
+        self.last_modified = {}
+        self.cached_weather_info = {}
+        self.last_stored_readings = {}  # Last buffered reading per city, without its timestamp
+        self.consecutive_failures = 0  # Runs in a row in which no city could be fetched
+        # Rows are buffered and written in one batch every `flush_interval` runs
+        self.flush_interval = config.get('flush_interval', 60)
+        self.runs_since_flush = 0
+        self.buffer = []
+        # Unbuffered rows are written right away, so the server's DEFAULT now() can stamp them.
+        # Buffered rows keep their collection time, as they are written up to `flush_interval` runs later.
+        self.client_timestamps = self.flush_interval > 1
+        self.columns = WEATHER_COLUMNS if self.client_timestamps else WEATHER_COLUMNS[:-1]
+        self.insert_name = INSERT_WEATHER_NAME.format(digest=zlib.crc32(', '.join(self.columns).encode()))
+        self.insert_weather = INSERT_WEATHER.format(
+            columns=', '.join(self.columns), params=', '.join(f"${i}" for i in range(1, len(self.columns) + 1))
+        )
+        self.execute_insert = EXECUTE_INSERT_WEATHER.format(
+            name=self.insert_name, params=', '.join(['%s'] * len(self.columns))
+        )
+        self.copy_weather = COPY_WEATHER.format(columns=', '.join(self.columns))
+        atexit.register(self.flush_weather_data)  # Persist a partial buffer on shutdown
+        logging.info(f"Initialized WeatherDataCollector for cities: {', '.join(self.cities)}")
+
+    def get_weather_data(self, city: str) -> dict:
         """
-        Fetches the weather data from the OpenWeatherMap API.
+        Fetches the weather data for a city from the OpenWeatherMap API.
+
+        Args:
+            city (str): The city to fetch the weather for.
 
         Returns:
             dict: A dictionary containing the weather information with column names initialized with units.
+                  Metric units are requested, so the API already reports the temperature in Celsius.
+                  The timestamp is only included when readings are buffered (see `client_timestamps`).
         """
-        url = f"http://api.openweathermap.org/data/2.5/weather?q={self.city}&appid={self.api_key}"
-        
+        logging.info(f"Fetching weather data for city: {city}")
+        headers = {}
+        if city in self.cached_weather_info:
+            if self.etags.get(city):
+                headers['If-None-Match'] = self.etags[city]
+            if self.last_modified.get(city):
+                headers['If-Modified-Since'] = self.last_modified[city]
+
         try:
-            logging.info(f"Fetching weather data for city: {self.city}")
-            response = requests.get(url)
+            response = self.session.get(
+                WEATHER_API_URL, params=self.params[city], headers=headers, timeout=5
+            )
             response.raise_for_status()  # Raise error for bad responses (4xx, 5xx)
-            data = response.json()
-
-            # Extract relevant data with column names including units
-            weather_info = {
-                'city': self.city,
-                'temperature (°C)': data['main']['temp'],
-                'humidity (%)': data['main']['humidity'],
-                'wind_speed (m/s)': data['wind']['speed'],
-                'weather': data['weather'][0]['description'],
-                'timestamp': datetime.now()
-            }
-            logging.info(f"Weather data fetched successfully for city: {self.city}")
-            return weather_info
-
         except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching weather data for city {self.city}: {e}")
+            logging.error(f"Error fetching weather data for city {city}: {e}")
             return {}
 
-    def clean_weather_data(self, data: dict) -> pd.DataFrame:
+        if response.status_code == 304:
+            # Nothing changed upstream, so reuse the cached reading
+            logging.info(f"Weather data not modified for city: {city}")
+            weather_info = self.cached_weather_info[city]
+        else:
+            try:
+                main, wind, conditions = API_RESPONSE_FIELDS(orjson.loads(response.content))
+
+                # Extract relevant data with column names including units (°C, %, m/s)
+                weather_info = {
+                    'city': city,
+                    'temperature_c': main['temp'],
+                    'humidity': main['humidity'],
+                    'wind_speed_ms': wind['speed'],
+                    'weather': conditions[0]['description']
+                }
+            except (orjson.JSONDecodeError, KeyError, IndexError, TypeError) as e:
+                logging.error(f"Invalid weather data received for city {city}: {e!r}")
+                return {}
+
+            self.etags[city] = response.headers.get('ETag')
+            self.last_modified[city] = response.headers.get('Last-Modified')
+            self.cached_weather_info[city] = weather_info
+            logging.info(f"Weather data fetched successfully for city: {city}")
+
+        if self.client_timestamps:
+            return {**weather_info, 'timestamp': datetime.now(timezone.utc)}
+        return weather_info
+
+    def store_weather_data(self, readings: list):
         """
-        Cleans the weather data by converting temperature from Kelvin to Celsius, rounding 
-        temperature to 2 decimal places.
+        Buffers the weather data of one run and flushes the buffer to the PostgreSQL database
+        every `flush_interval` runs. Readings identical to the last stored one for the same
+        city (apart from the timestamp) are skipped.
 
         Args:
-            data (dict): The raw weather data fetched from the API.
-
-        Returns:
-            pd.DataFrame: A cleaned DataFrame with temperature rounded to 2 decimal places.
+            readings (list): The weather data dictionaries returned by get_weather_data.
         """
-        if not data:
-            logging.warning("No weather data to clean.")
-            return pd.DataFrame()
+        for data in readings:
+            if not data:
+                logging.warning("No data to store.")
+                continue
 
-        df = pd.DataFrame([data])
+            reading = {column: value for column, value in data.items() if column != 'timestamp'}
+            if reading == self.last_stored_readings.get(data['city']):
+                logging.info(f"Weather data unchanged for city: {data['city']}, skipping.")
+                continue
+            self.last_stored_readings[data['city']] = reading
+            self.buffer.append(tuple(data[column] for column in self.columns))
 
-        # Convert temperature from Kelvin to Celsius and round to 2 decimal places
-        df['temperature (°C)'] = (df['temperature (°C)'] - 273.15).round(2)
+        self.runs_since_flush += 1
+        logging.info(f"Buffered {len(self.buffer)} rows over {self.runs_since_flush}/{self.flush_interval} runs.")
 
-        logging.info(f"Weather data cleaned for city: {self.city}")
-        return df
+        if self.runs_since_flush >= self.flush_interval:
+            self.flush_weather_data()
 
-    def store_weather_data(self, df: pd.DataFrame):
+    def drop_buffered_rows(self, count: int):
         """
-        Stores the cleaned weather data into the PostgreSQL database.
+        Drops the oldest rows from the buffer. Cities left without a buffered row are forgotten
+        in `last_stored_readings`, so their next reading is stored even if it is unchanged.
 
         Args:
-            df (pd.DataFrame): The cleaned weather data in a DataFrame.
+            count (int): The number of rows to drop.
         """
-        if df.empty:
-            logging.warning("No data to store.")
+        dropped_cities = {row[0] for row in self.buffer[:count]}
+        del self.buffer[:count]
+        dropped_cities -= {row[0] for row in self.buffer}
+        for city in dropped_cities:
+            self.last_stored_readings.pop(city, None)
+
+    def flush_weather_data(self):
+        """
+        Writes all buffered rows to the PostgreSQL database, using COPY for multi-row batches.
+        Rows are kept in the buffer if the write fails so the next flush can retry them, up to
+        `MAX_BUFFERED_ROWS` rows; beyond that the oldest rows are dropped. Rows without a client
+        timestamp (see `client_timestamps`) are not retried, as the server would stamp them late.
+        """
+        self.runs_since_flush = 0
+        if not self.buffer:
             return
 
+        conn = None
+        broken = False
         try:
-            engine = create_engine(self.db_url)
-            df.to_sql('weather', con=engine, if_exists='append', index=False)
-            logging.info(f"Data successfully stored in the database for city: {self.city}")
+            conn = get_connection_pool(self.db_url).getconn()
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                if len(self.buffer) == 1:
+                    # Prepared statements live on the server session, so prepare once per pooled connection
+                    prepare_statement(cursor, self.insert_name, self.insert_weather)
+                    cursor.execute(self.execute_insert, self.buffer[0])
+                else:
+                    data = io.StringIO()
+                    csv.writer(data).writerows(self.buffer)
+                    data.seek(0)
+                    cursor.copy_expert(self.copy_weather, data)
+            logging.info(f"{len(self.buffer)} rows successfully stored in the database.")
+            self.buffer.clear()
 
         except Exception as e:
-            logging.error(f"Error while storing data for city {self.city}: {e}")
+            logging.error(f"Error while storing weather data: {e}")
+            broken = True
+            if not self.client_timestamps:
+                logging.warning(f"Dropped {len(self.buffer)} rows that carry no timestamp of their own.")
+                self.drop_buffered_rows(len(self.buffer))
+            elif len(self.buffer) > MAX_BUFFERED_ROWS:
+                dropped = len(self.buffer) - MAX_BUFFERED_ROWS
+                self.drop_buffered_rows(dropped)
+                logging.warning(f"Buffer is full, dropped the {dropped} oldest rows.")
+        finally:
+            if conn:
+                if broken:
+                    # Don't hand a possibly broken connection back to the pool
+                    _PREPARED_STATEMENTS.pop(conn, None)
+                get_connection_pool(self.db_url).putconn(conn, close=broken)
 
     def run(self):
         """
-        Executes the process of fetching, cleaning, and storing weather data.
+        Executes the process of fetching the weather data for all cities concurrently and storing it.
         """
-        weather_data = self.get_weather_data()
-        clean_data = self.clean_weather_data(weather_data)
-        self.store_weather_data(clean_data)
+        readings = list(self.executor.map(self.get_weather_data, self.cities))
+        self.consecutive_failures = 0 if any(readings) else self.consecutive_failures + 1
+        self.store_weather_data(readings)
 
 
 class WeatherScheduler:
@@ -249,42 +507,64 @@ class WeatherScheduler:
         self.interval_seconds = interval_seconds
         logging.info(f"WeatherScheduler initialized to run every {self.interval_seconds} seconds.")
 
-    def schedule_job(self):
+    def get_interval(self) -> int:
         """
-        Schedules the weather data collection job.
+        Returns the interval until the next run. After `FAILURE_THRESHOLD` consecutive failed runs
+        the interval is doubled for every further failure (up to `MAX_BACKOFF_FACTOR` times), and it
+        is reset once a run succeeds.
+
+        Returns:
+            int: The interval in seconds.
         """
-        schedule.every(self.interval_seconds).seconds.do(self.collector.run)
-        logging.info(f"Scheduled job to run every {self.interval_seconds} seconds.")
+        failures = self.collector.consecutive_failures
+        if failures < FAILURE_THRESHOLD:
+            return self.interval_seconds
+
+        interval = self.interval_seconds * min(2 ** (failures - FAILURE_THRESHOLD + 1), MAX_BACKOFF_FACTOR)
+        logging.warning(f"{failures} consecutive failed runs, next run in {interval} seconds.")
+        return interval
 
     def start(self):
         """
         Starts the scheduler to run the job at defined intervals.
         """
         logging.info("Starting the scheduler...")
+        start_time = time.monotonic()
         while True:
-            schedule.run_pending()
-            time.sleep(1)
+            interval = self.get_interval()
+            if self.collector.consecutive_failures < FAILURE_THRESHOLD:
+                # Sleep until the next multiple of the interval since start, so runs don't drift
+                time.sleep(interval - (time.monotonic() - start_time) % interval)
+            else:
+                # Backing off: wait the full interval after the failed run
+                time.sleep(interval)
+            self.collector.run()
 
 
 if __name__ == "__main__":
     # Load the configuration from config.json
-    with open('config.json', 'r') as config_file:
-        config = json.load(config_file)
+    with open('config.json', 'rb') as config_file:
+        config = orjson.loads(config_file.read())
 
     # Extract database URL from the config
     db_url = config['db_url']
 
     # Start PostgreSQL service before running the rest of the script
-    start_postgresql()
+    db_location = urlparse(db_url)
+    start_postgresql(db_location.hostname or 'localhost', db_location.port or 5432)
 
-    # Create the database if it does not exist
+    # Create the database and the weather table if they do not exist
     create_database_if_not_exists(db_url)
+    create_weather_table_if_not_exists(db_url)
 
     # Instantiate the WeatherDataCollector with config data
     collector = WeatherDataCollector(config)
 
+    # atexit handlers don't run when the process is killed by SIGTERM (systemctl stop, docker stop),
+    # so turn it into a normal exit to flush the buffered readings
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     # Instantiate and start the scheduler
     scheduler = WeatherScheduler(collector, interval_seconds=10)
-    scheduler.schedule_job()
     scheduler.start()
 